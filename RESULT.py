@@ -1,4 +1,10 @@
+import csv
 import os
+import re
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
 
 LOG_PATH    = "81_EventLogReport.txt"  # 入力ログ
 BIN_SECONDS = 3600
@@ -10,16 +16,22 @@ OUT_DIR     = "81_result" # 出力フォルダ
 if not os.path.exists(OUT_DIR):
     os.makedirs(OUT_DIR)
 
+# 名前の判定に使う正規表現（大文字/小文字は無視）
+BOX_RE = re.compile(r"^box", re.IGNORECASE)
+DO_RE = re.compile(r"^do", re.IGNORECASE)
+ID_HIGH_RE = re.compile(r"^m_h", re.IGNORECASE)  # m_h, m_hp, m_hq, m_hr ... ぜんぶ含む
+ID_LOW_RE = re.compile(r"^m_l", re.IGNORECASE)
+
 # 便利関数
 def is_box(name):
     if name is None:
         return False
-    return str(name).lower().startswith("box")
+    return BOX_RE.match(name) is not None
 
 def is_do(name):
     if name is None:
         return False
-    return str(name).lower().startswith("do")
+    return DO_RE.match(name) is not None
 
 def is_high_id(mid):
     """
@@ -30,172 +42,235 @@ def is_high_id(mid):
     """
     if mid is None:
         return False
-    s = str(mid).lower()
-    return s.startswith("m_h")  # m_h, m_hp, m_hq, m_hr ... ぜんぶ含む
+    return ID_HIGH_RE.match(mid) is not None
 
 def is_low_id(mid):
     if mid is None:
         return False
-    return str(mid).lower().startswith("m_l")
+    return ID_LOW_RE.match(mid) is not None
+
+# 末尾の数字（自然順ソート用）
+TAIL_DIGITS_RE = re.compile(r"(\d+)$")
 
 def natural_sort_ids(ids_list):
     def sort_key(s):
         s = str(s)
-        num = ""
-        i = len(s) - 1
-        while i >= 0 and s[i].isdigit():
-            num = s[i] + num
-            i -= 1
-        if num == "":
-            return (s, -1)
-        head = s[:len(s) - len(num)]
-        try:
-            return (head, int(num))
-        except:
+        m = TAIL_DIGITS_RE.search(s)
+        if m is None:
             return (s, -1)
+        return (s[:m.start()], int(m.group(1)))
     lst = list(ids_list)
     lst.sort(key=sort_key)
     return lst
 
 # ログ読込
-# events の要素は {"time","type"('C'|'R'|'D'),"src","dst","id"}
-events = []
-with open(LOG_PATH, "r", encoding="utf-8", errors="ignore") as f:
-    for raw in f:
-        line = raw.strip()
-        if not line:
-            continue
-        parts = line.split()
-        try:
-            t = float(parts[0])
-        except:
-            continue
-        typ = parts[1] if len(parts) > 1 else None
-
-        # C 行（4フィールド想定）: time C src id
-        if typ == "C" and len(parts) >= 4:
-            src = parts[2]
-            mid = parts[3]
-            events.append({"time": t, "type": "C", "src": src, "dst": None, "id": mid})
-            continue
-
-        # DE ... R / D を R / D に正規化
-        if typ == "DE" and len(parts) >= 6:
-            src = parts[2]; dst = parts[3]; mid = parts[4]; st = parts[5]
-            if st == "R":
-                events.append({"time": t, "type": "R", "src": src, "dst": dst, "id": mid})
-            elif st == "D":
-                events.append({"time": t, "type": "D", "src": src, "dst": dst, "id": mid})
-            continue
-
-# 分母ノード（src/dst のユニーク）。box* / do* は設定に従って除外
-nodes_all = set()
-for e in events:
-    if e.get("src") is not None:
-        nodes_all.add(e["src"])
-    if e.get("dst") is not None:
-        nodes_all.add(e["dst"])
-
-filtered_nodes = set()
-for n in nodes_all:
-    if EXCLUDE_BOX and is_box(n):
-        continue
-    if EXCLUDE_DO and is_do(n):
-        continue
-    filtered_nodes.add(n)
-nodes_all = filtered_nodes
-N = len(nodes_all)
-
-# 高重要度：R または D を“受信”として、初回だけを時間ごとにカウント
-# 宛先が box / do の行は、分母に合わせて除外
-rd_events_high = []
-for e in events:
-    if (e["type"] == "R" or e["type"] == "D") and is_high_id(e["id"]):
-        if EXCLUDE_BOX and is_box(e["dst"]):
-            continue
-        if EXCLUDE_DO and is_do(e["dst"]):
-            continue
-        rd_events_high.append(e)
+# 1行のフィールド数は種別ごとに異なる（C: 4, DE: 6）ので、最大6列として読み込み足りない列は欠損にする
+LOG_COLUMNS = ["time", "type", "f2", "f3", "f4", "f5"]
+CHUNK_ROWS = 200000  # 一度に読み込む行数（メモリ使用量はこの行数分で頭打ち）
+
+def normalize_events(raw):
+    """
+    読み込んだ生の行から C / R / D の行だけを取り出し、
+    time, type, src, dst, id の列を持つ DataFrame にして返す
+    （DE 行の Status R / D を type の R / D に正規化）
+    """
+    raw = raw.assign(time=pd.to_numeric(raw["time"], errors="coerce"))
+    raw = raw[raw["time"].notna()]
+
+    # C 行（4フィールド想定）: time C src id
+    is_c = (raw["type"] == "C") & raw["f3"].notna()
+    # DE 行: time DE src dst id R|D
+    is_rd = (raw["type"] == "DE") & raw["f5"].isin(["R", "D"])
+
+    df = pd.DataFrame({
+        "time": raw["time"],
+        "type": raw["type"].where(is_c, raw["f5"]),
+        "src": raw["f2"],
+        "dst": raw["f3"].where(is_rd),
+        "id": raw["f3"].where(is_c, raw["f4"]),
+    })
+    return df[is_c | is_rd]
+
+def iter_event_chunks(path):
+    """EventLogReport を CHUNK_ROWS 行ずつ読み、normalize_events した DataFrame を順に返す"""
+    try:
+        reader = pd.read_csv(path, sep=r"\s+", engine="c", header=None, names=LOG_COLUMNS,
+                             dtype=str, on_bad_lines="skip", skip_blank_lines=True,
+                             encoding="utf-8", encoding_errors="ignore", chunksize=CHUNK_ROWS)
+    except pd.errors.EmptyDataError:
+        # 空のログ
+        return
+    for raw in reader:
+        yield normalize_events(raw)
+
+# ノード名・メッセージIDは整数コードに置き換えて扱う（コード = 各 table の添字）
+TYPE_C, TYPE_R, TYPE_D = 0, 1, 2
+
+node_table = []      # コード -> ノード名
+node_codes = {}      # ノード名 -> コード
+
+msg_table = []       # コード -> メッセージID
+msg_codes = {}       # メッセージID -> コード
+
+def intern_nodes(col):
+    """ノード名の列をコードの int32 配列に変換（欠損は -1）"""
+    local, uniques = pd.factorize(col)
+    for name in uniques:
+        if name not in node_codes:
+            node_codes[name] = len(node_table)
+            node_table.append(name)
+    # 末尾の -1 は欠損（local == -1）の行き先
+    lookup = np.array([node_codes[name] for name in uniques] + [-1], dtype=np.int32)
+    return lookup[local]
+
+def intern_msgs(col):
+    """メッセージIDの列をコードの int32 配列に変換（欠損は -1）"""
+    local, uniques = pd.factorize(col)
+    for mid in uniques:
+        if mid not in msg_codes:
+            msg_codes[mid] = len(msg_table)
+            msg_table.append(mid)
+    lookup = np.array([msg_codes[mid] for mid in uniques] + [-1], dtype=np.int32)
+    return lookup[local]
+
+def compute_hourly(times, dst_ids, mid_ids, n_ids, total_hours, bin_seconds):
+    """
+    受信（times, dst_ids, mid_ids の並列配列）から、ID×時間帯ごとの“初回受信ノード数”を数える
+      - (id, dst) ごとに最も早い受信だけを残し、その時刻が入る時間帯 (start, end] に数える
+      - 集計対象は (0, total_hours * bin_seconds] の範囲のみ
+    戻り値: (counts, cum) いずれも shape (n_ids, total_hours)、cum は時間方向の累積
+    """
+    # 時間帯の添字（0始まり）。境界 end ちょうどはその時間帯に入る
+    edges = np.arange(1, total_hours + 1) * bin_seconds
+    hour = np.searchsorted(edges, times, side="left")
+    in_range = (times > 0) & (hour < total_hours)
+
+    # id -> dst -> time の順に1回だけ並べ替える。(id, dst) ごとのまとまりの先頭 = 初回受信
+    order = np.lexsort((times[in_range], dst_ids[in_range], mid_ids[in_range]))
+    hour = hour[in_range][order]
+    dst_ids = dst_ids[in_range][order]
+    mid_ids = mid_ids[in_range][order].astype(np.int64)
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (mid_ids[1:] != mid_ids[:-1]) | (dst_ids[1:] != dst_ids[:-1])
+
+    counts = np.bincount(mid_ids[first] * total_hours + hour[first],
+                         minlength=n_ids * total_hours).reshape(n_ids, total_hours)
+    return counts, counts.cumsum(axis=1)
+
+# ログを1回だけ走査し（全行をリストに溜めずに）、以降の集計に使うものをまとめて作る
+#   - 分母ノード（src/dst のユニーク）: node_table そのもの
+#   - R / D の行（time, dst, id のコード）
+#   - ID ごとの C の件数と、D のあった ID
+# box / do や高重要度 / 低重要度の判定は、走査後にユニークな名前に対して1回ずつ行う
+times_rd_parts = []
+dsts_rd_parts = []
+mids_rd_parts = []
+created_per_code = defaultdict(int)
+delivered_parts = []
+for chunk in iter_event_chunks(LOG_PATH):
+    times = chunk["time"].to_numpy(dtype=np.float64)
+    types = np.select([chunk["type"] == "C", chunk["type"] == "R"], [TYPE_C, TYPE_R], TYPE_D).astype(np.uint8)
+    intern_nodes(chunk["src"])  # src は分母ノードとして登録するだけ
+    dst_ids = intern_nodes(chunk["dst"])
+    mid_ids = intern_msgs(chunk["id"])
+
+    # R / D
+    is_rd = types != TYPE_C
+    times_rd_parts.append(times[is_rd])
+    dsts_rd_parts.append(dst_ids[is_rd])
+    mids_rd_parts.append(mid_ids[is_rd])
+
+    # C
+    codes, n_created = np.unique(mid_ids[types == TYPE_C], return_counts=True)
+    for code, n in zip(codes.tolist(), n_created.tolist()):
+        created_per_code[code] += n
+
+    # D
+    delivered_parts.append(np.unique(mid_ids[types == TYPE_D]))
+
+times_rd = np.concatenate(times_rd_parts) if times_rd_parts else np.zeros(0, dtype=np.float64)
+dsts_rd = np.concatenate(dsts_rd_parts) if dsts_rd_parts else np.zeros(0, dtype=np.int32)
+mids_rd = np.concatenate(mids_rd_parts) if mids_rd_parts else np.zeros(0, dtype=np.int32)
+
+# コード -> 判定 の表（ユニークなノード名 / ID ごとに1回だけ判定）
+node_excluded = np.array([(EXCLUDE_BOX and is_box(n)) or (EXCLUDE_DO and is_do(n)) for n in node_table], dtype=bool)
+id_is_high = np.array([is_high_id(m) for m in msg_table], dtype=bool)
+id_is_low = np.array([is_low_id(m) for m in msg_table], dtype=bool)
+
+# 分母ノード（box* / do* は設定に従って除外）
+N = int(np.count_nonzero(~node_excluded))
+
+# 高重要度：R または D を“受信”として扱う。宛先が box / do の行は、分母に合わせて除外
+rd_high_mask = id_is_high[mids_rd] & ~node_excluded[dsts_rd]
+times_high = times_rd[rd_high_mask]
+dsts_high = dsts_rd[rd_high_mask]
+mids_high = mids_rd[rd_high_mask]
+
+# 低重要度：C の件数（L）と D のあった ID（P）
+L_per_id = {}
+L_total = 0
+for code, n in created_per_code.items():
+    if id_is_low[code]:
+        L_per_id[msg_table[code]] = n
+        L_total = L_total + n
+# D のあった低重要度 ID（コードの添字で引く 0/1 の表）
+delivered_low = np.zeros(len(msg_table), dtype=np.uint8)
+if delivered_parts:
+    delivered_low[np.concatenate(delivered_parts)] = 1
+delivered_low[~id_is_low] = 0
 
 # ID一覧（M_H, M_Hp*, M_Hq*, M_Hr* を含む）
-mh_ids_set = set()
-for e in rd_events_high:
-    mh_ids_set.add(e["id"])
-mh_ids = natural_sort_ids(mh_ids_set)
+mh_codes = {}
+for code in np.unique(mids_high).tolist():
+    mh_codes[msg_table[code]] = code
+mh_ids = natural_sort_ids(mh_codes.keys())
+
+# (id, dst) ごとの初回受信を時間ごとに数える
+hours = list(range(1, TOTAL_HOURS + 1))
+counts, cum = compute_hourly(times_high, dsts_high, mids_high, len(msg_table), TOTAL_HOURS, BIN_SECONDS)
 
-# 1時間ごとの“初回受信ノード数”と率[%]、累積[%]
+# CSV 出力は大きめのバッファで開き、行をまとめて書き出す
+WRITE_BUFFER_BYTES = 1 << 20  # 出力ファイルのバッファサイズ
+WRITE_BATCH_ROWS = 10000      # 一度に書き出す行数
+
+# 1時間ごとの“初回受信ノード数”と率[%]、累積[%]（ID×時間帯の表からまとめて作る）
+rows_codes = np.array([mh_codes[mid] for mid in mh_ids], dtype=np.int64)
+n_hour = counts[rows_codes]
+n_cum = cum[rows_codes]
+if N > 0:
+    rate_hour = n_hour / N * 100.0
+    cum_rate = n_cum / N * 100.0
+else:
+    rate_hour = np.zeros(n_hour.shape)
+    cum_rate = np.zeros(n_cum.shape)
+
+# 出力（四捨五入）。1行 = (ID, 時間帯)
+high_df = pd.DataFrame({
+    "Id": np.repeat(mh_ids, TOTAL_HOURS),
+    "hour_index": np.tile(hours, len(mh_ids)),
+    "N": N,
+    "n_firsttime_receivers_hour": n_hour.ravel(),
+    "rate_percent_hour": np.round(rate_hour).astype(np.int64).ravel(),
+    "cumulative_rate_percent": np.round(cum_rate).astype(np.int64).ravel(),
+})
 high_csv_path = os.path.join(OUT_DIR, "MH_hourly_firsttime_81.csv")
-with open(high_csv_path, "w", encoding="utf-8") as f:
-    f.write("Id,hour_index,N,n_firsttime_receivers_hour,rate_percent_hour,cumulative_rate_percent\n")
-    for mid in mh_ids:
-        already_seen_nodes = set()  # そのIDで既に受信済みノード
-
-        h = 1
-        while h <= TOTAL_HOURS:
-            start_time = (h - 1) * BIN_SECONDS
-            end_time   = h * BIN_SECONDS
-
-            # この時間帯に R か D を受け取った宛先（ユニーク）
-            hour_receivers = set()
-            for e in rd_events_high:
-                if e["id"] == mid:
-                    if e["time"] > start_time and e["time"] <= end_time:
-                        hour_receivers.add(e["dst"])
-
-            # 初回だけ残す
-            first_time_nodes = set()
-            for node in hour_receivers:
-                if node not in already_seen_nodes:
-                    first_time_nodes.add(node)
-
-            # その時間の新規受信台数と率
-            n_hour = len(first_time_nodes)
-            if N > 0:
-                rate_hour = (n_hour / N) * 100.0
-            else:
-                rate_hour = 0.0
-
-            # 累積更新
-            for node in first_time_nodes:
-                already_seen_nodes.add(node)
-            if N > 0:
-                cum_rate = (len(already_seen_nodes) / N) * 100.0
-            else:
-                cum_rate = 0.0
-
-            # 出力（四捨五入）
-            f.write(mid + "," + str(h) + "," + str(N) + "," + str(n_hour) + "," + str(round(rate_hour)) + "," + str(round(cum_rate)) + "\n")
-
-            h = h + 1
+with open(high_csv_path, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER_BYTES) as f:
+    high_df.to_csv(f, index=False, lineterminator="\n", chunksize=WRITE_BATCH_ROWS)
 
 # 低重要度：C と“初回 D”のみ（※ do除外の影響は分母Nにのみ反映。到達そのものの判定は従来どおり）
-# L（作成数）
-L_per_id = {}
-L_total = 0
-for e in events:
-    if e["type"] == "C" and is_low_id(e["id"]):
-        mid = e["id"]
-        if mid not in L_per_id:
-            L_per_id[mid] = 0
-        L_per_id[mid] = L_per_id[mid] + 1
-        L_total = L_total + 1
-
-# P（初回Dあり）
-delivered_once_ids = set()
-for e in events:
-    if e["type"] == "D" and is_low_id(e["id"]):
-        delivered_once_ids.add(e["id"])
-P_total = len(delivered_once_ids)
+# L（作成数）と P（初回Dあり）は上の走査で集計済み
+P_total = int(np.count_nonzero(delivered_low))
 
 # 全体サマリ
 low_summary_path = os.path.join(OUT_DIR, "ML_arrival_rate_81.csv")
-with open(low_summary_path, "w", encoding="utf-8") as f:
+with open(low_summary_path, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER_BYTES) as f:
+    w = csv.writer(f, lineterminator="\n")
     if L_total > 0:
         rate_total = (P_total / L_total) * 100.0
     else:
         rate_total = 0.0
-    f.write("L_created_messages,P_first_delivered_messages,arrival_rate_percent\n")
-    f.write(str(L_total) + "," + str(P_total) + "," + str(round(rate_total, 1)) + "\n")
+    w.writerow(["L_created_messages", "P_first_delivered_messages", "arrival_rate_percent"])
+    w.writerow([L_total, P_total, round(rate_total, 1)])
 
 # ID別
 def natural_sorted_keys(d):
@@ -205,12 +280,18 @@ def natural_sorted_keys(d):
     return natural_sort_ids(lst)
 
 low_byid_path = os.path.join(OUT_DIR, "ML_arrival_rate_by_id_81.csv")
-with open(low_byid_path, "w", encoding="utf-8") as f:
-    f.write("Id,L_created,P_first_delivered,arrival_rate_percent\n")
+with open(low_byid_path, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER_BYTES) as f:
+    w = csv.writer(f, lineterminator="\n")
+    w.writerow(["Id", "L_created", "P_first_delivered", "arrival_rate_percent"])
+    rows = []
     for mid in natural_sorted_keys(L_per_id):
         L_i = L_per_id.get(mid, 0)
-        P_i = 1 if mid in delivered_once_ids else 0
+        P_i = int(delivered_low[msg_codes[mid]])
         rate_i = (P_i / L_i) * 100.0 if L_i > 0 else 0.0
-        f.write(mid + "," + str(L_i) + "," + str(P_i) + "," + str(round(rate_i, 1)) + "\n")
+        rows.append([mid, L_i, P_i, round(rate_i, 1)])
+        if len(rows) >= WRITE_BATCH_ROWS:
+            w.writerows(rows)
+            rows.clear()
+    w.writerows(rows)
 
-print("OK")
\ No newline at end of file
+print("OK")
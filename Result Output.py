@@ -14,6 +14,7 @@ EventLogReport（CONN, C, S, DE）から以下を集計：
 from pathlib import Path
 import re
 import math
+import numpy as np
 import pandas as pd
 
 # ===================== 設定 =====================
@@ -34,6 +35,10 @@ ID_LOW_RE = re.compile(r"^M_L", re.IGNORECASE)
 BIN_SECONDS = 3600
 TOTAL_HOURS = 12   # 12時間想定（必要に応じて変更）
 
+# 出力ファイルのバッファサイズと、まとめて書き出す行数
+WRITE_BUFFER_BYTES = 1 << 20
+WRITE_BATCH_ROWS = 10000
+
 # クラスタ判定（ノード名で振り分ける場合）
 CLUSTER_REGEX = {
     "p": re.compile(r"^p\d+$", re.IGNORECASE),
@@ -45,37 +50,30 @@ CLUSTER_REGEX = {
 
 def parse_eventlogreport(path: Path) -> pd.DataFrame:
     """EventLogReport（CONN / C / S / DE）をDataFrameに正規化"""
-    rows = []
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        for raw in f:
-            line = raw.strip()
-            if not line:
-                continue
-            parts = line.split()
-            # time
-            try:
-                t = float(parts[0])
-            except Exception:
-                continue
-            etype = parts[1] if len(parts) > 1 else None
-
-            if etype == "CONN" and len(parts) >= 5:
-                src, dst, state = parts[2], parts[3], parts[4]
-                rows.append(dict(Time=t, Type="CONN", Src=src, Dst=dst, Id=None, Status=state))
-            elif etype == "C" and len(parts) >= 4:
-                src, mid = parts[2], parts[3]
-                rows.append(dict(Time=t, Type="C", Src=src, Dst=None, Id=mid, Status=None))
-            elif etype == "S" and len(parts) >= 5:
-                src, dst, mid = parts[2], parts[3], parts[4]
-                rows.append(dict(Time=t, Type="S", Src=src, Dst=dst, Id=mid, Status=None))
-            elif etype == "DE" and len(parts) >= 6:
-                src, dst, mid, st = parts[2], parts[3], parts[4], parts[5]
-                rows.append(dict(Time=t, Type="DE", Src=src, Dst=dst, Id=mid, Status=st))
-            else:
-                # 未知形式は無視
-                continue
-    df = pd.DataFrame(rows)
-    return df
+    # 種別ごとにフィールド数が違う（C: 4, CONN/S: 5, DE: 6）ので最大6列で読み、足りない列は欠損
+    raw = pd.read_csv(path, sep=r"\s+", engine="c", header=None,
+                      names=["Time", "Type", "F2", "F3", "F4", "F5"],
+                      dtype=str, on_bad_lines="skip", skip_blank_lines=True,
+                      encoding="utf-8", encoding_errors="ignore")
+    raw["Time"] = pd.to_numeric(raw["Time"], errors="coerce")
+    raw = raw[raw["Time"].notna()]
+
+    etype = raw["Type"]
+    is_conn = (etype == "CONN") & raw["F4"].notna()
+    is_c = (etype == "C") & raw["F3"].notna()
+    is_s = (etype == "S") & raw["F4"].notna()
+    is_de = (etype == "DE") & raw["F5"].notna()
+
+    df = pd.DataFrame({
+        "Time": raw["Time"],
+        "Type": etype,
+        "Src": raw["F2"],
+        "Dst": raw["F3"].where(is_conn | is_s | is_de),
+        "Id": raw["F3"].where(is_c, raw["F4"].where(is_s | is_de)),
+        "Status": raw["F4"].where(is_conn, raw["F5"].where(is_de)),
+    })
+    # 未知形式は無視
+    return df[is_conn | is_c | is_s | is_de].reset_index(drop=True)
 
 
 def compute_denominator_nodes(df: pd.DataFrame, exclude_box: bool = True) -> set:
@@ -94,10 +92,78 @@ def natural_key(mid: str):
     return (mid if m is None else mid[:m.start()], int(m.group(1)) if m else -1, mid)
 
 
-def hourly_bins(total_hours: int, bin_sec: int):
-    """(hour_index, start, end) のタプルを返す（hour_indexは1始まり）"""
-    for h in range(1, total_hours + 1):
-        yield h, (h - 1) * bin_sec, h * bin_sec
+def hour_of(times: np.ndarray, total_hours: int, bin_sec: int) -> np.ndarray:
+    """各時刻が入る時間帯 hour_index（1始まり、区間は (start, end]）。範囲外は 0"""
+    edges = np.arange(1, total_hours + 1) * bin_sec
+    idx = np.searchsorted(edges, times, side="left")
+    return np.where((times > 0) & (idx < total_hours), idx + 1, 0)
+
+
+def hourly_receiver_counts(rx: pd.DataFrame, group_cols: list, full_index: pd.MultiIndex):
+    """
+    受信（group_cols..., Dst, h の列）から、グループ×時間帯ごとに
+      - その時間に受信したユニーク宛先台数
+      - 累積ユニーク宛先台数（宛先ごとの初回受信の時間帯で数えて累積）
+    を full_index（group_cols..., h）の順に並べて返す
+    """
+    keys = group_cols + ["h"]
+    n_hour = rx.groupby(keys)["Dst"].nunique().reindex(full_index, fill_value=0)
+    first_h = rx.groupby(group_cols + ["Dst"])["h"].min().reset_index()
+    n_first = first_h.groupby(keys).size().reindex(full_index, fill_value=0)
+    n_cum = n_first.groupby(level=group_cols).cumsum()
+    return n_hour.to_numpy(), n_cum.to_numpy()
+
+
+def open_output(path: Path):
+    """出力ファイルを大きめのバッファで開く（行ごとの小さな書き込みをまとめる）"""
+    return open(path, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER_BYTES)
+
+
+def write_csv(df: pd.DataFrame, path: Path, **kwargs):
+    """DataFrame を open_output で開いたファイルに WRITE_BATCH_ROWS 行ずつ書き出す"""
+    with open_output(path) as f:
+        df.to_csv(f, chunksize=WRITE_BATCH_ROWS, **kwargs)
+
+
+def match_categories(col: pd.Series, rgx: re.Pattern) -> np.ndarray:
+    """カテゴリ型の列に対し、正規表現をユニーク値ごとに1回だけ当てたブール配列（欠損は False）"""
+    hit = np.asarray(col.cat.categories.astype(str).str.match(rgx), dtype=bool)
+    # codes の -1（欠損）は末尾の False を指す
+    return np.append(hit, False)[col.cat.codes.to_numpy()]
+
+
+def cluster_of_categories(col: pd.Series) -> np.ndarray:
+    """カテゴリ型のノード名列をクラスタ名（CLUSTER_REGEX のキー、該当なしは None）に変換"""
+    names = col.cat.categories.astype(str)
+    conds = [np.asarray(names.str.match(rgx), dtype=bool) for rgx in CLUSTER_REGEX.values()]
+    per_category = np.select(conds, list(CLUSTER_REGEX.keys()), default=None)
+    return np.append(per_category, None)[col.cat.codes.to_numpy()]
+
+
+def add_classification_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Id / Dst の正規表現による判定を、ユニーク値ごとに1回だけ行って補助列として付ける
+      - _id_high: Id が ID_HIGH_RE に一致
+      - _id_low : Id が ID_LOW_RE に一致
+      - _dst_box: Dst が BOX_RE に一致
+      - _cluster: Dst のクラスタ名（CLUSTER_REGEX のキー、該当なしは None）
+    """
+    ids = df["Id"].astype("category")
+    dsts = df["Dst"].astype("category")
+    return df.assign(
+        _id_high=match_categories(ids, ID_HIGH_RE),
+        _id_low=match_categories(ids, ID_LOW_RE),
+        _dst_box=match_categories(dsts, BOX_RE),
+        _cluster=cluster_of_categories(dsts),
+    )
+
+
+def select_high_R(df: pd.DataFrame) -> pd.DataFrame:
+    """高重要度 M_H* の R 受信（DE行）。分母に合わせて受信側の boxNN を除外"""
+    mask = (df["Type"] == "DE") & (df["Status"] == "R") & df["_id_high"]
+    if EXCLUDE_BOX_IN_DENOM:
+        mask &= ~df["_dst_box"]
+    return df[mask]
 
 
 def calc_high_hourly_R_based(df: pd.DataFrame, nodes_all: set, out_dir: Path):
@@ -107,46 +173,41 @@ def calc_high_hourly_R_based(df: pd.DataFrame, nodes_all: set, out_dir: Path):
     - 累積ユニーク宛先 / N * 100
     """
     N = len(nodes_all)
-    high_R = df[
-        (df["Type"] == "DE")
-        & df["Id"].notna() & df["Id"].astype(str).str.match(ID_HIGH_RE)
-        & (df["Status"] == "R")
-    ].copy()
-
-    # 分母に合わせて受信側の boxNN を除外
-    if EXCLUDE_BOX_IN_DENOM:
-        high_R = high_R[~high_R["Dst"].astype(str).str.match(BOX_RE)]
+    high_R = select_high_R(df)
 
     mh_ids = sorted(high_R["Id"].dropna().astype(str).unique().tolist(), key=natural_key)
 
-    # 長い形式
-    records = []
-    for mid in mh_ids:
-        sub = high_R[high_R["Id"] == mid].copy()
-        seen = set()
-        for h, start, end in hourly_bins(TOTAL_HOURS, BIN_SECONDS):
-            h_slice = sub[(sub["Time"] > start) & (sub["Time"] <= end)]
-            n_hour = h_slice["Dst"].astype(str).nunique()
-            rate_hour = (n_hour / N * 100.0) if N > 0 else float("nan")
-            seen.update(h_slice["Dst"].astype(str).unique())
-            cum_rate = (len(seen) / N * 100.0) if N > 0 else float("nan")
-            records.append([mid, h, N, n_hour, round(rate_hour), round(cum_rate)])
-
-    long_df = pd.DataFrame(records, columns=[
-        "Id", "hour_index", "N", "n_receivers_hour", "rate_percent_hour", "cumulative_rate_percent"
-    ])
+    # 各受信を時間帯に振り分け（範囲外は除く）、宛先はカテゴリのコード（小さな整数）で扱う
+    h = hour_of(high_R["Time"].to_numpy(), TOTAL_HOURS, BIN_SECONDS)
+    rx = pd.DataFrame({
+        "Id": high_R["Id"].to_numpy(),
+        "Dst": high_R["Dst"].astype(str).astype("category").cat.codes.to_numpy(),
+        "h": h,
+    })[h > 0]
+
+    full_index = pd.MultiIndex.from_product([mh_ids, range(1, TOTAL_HOURS + 1)], names=["Id", "h"])
+    n_hour, n_cum = hourly_receiver_counts(rx, ["Id"], full_index)
+
+    # 長い形式（N > 0 でなければ受信もないので行は出ない）
+    long_df = pd.DataFrame({
+        "Id": full_index.get_level_values("Id"),
+        "hour_index": full_index.get_level_values("h"),
+        "N": N,
+        "n_receivers_hour": n_hour,
+        "rate_percent_hour": np.round(n_hour / N * 100.0).astype(int) if N > 0 else n_hour,
+        "cumulative_rate_percent": np.round(n_cum / N * 100.0).astype(int) if N > 0 else n_cum,
+    })
     long_csv = out_dir / "MH_all_hourly_progression_Rbased.csv"
     long_txt = out_dir / "MH_all_hourly_progression_Rbased.txt"
-    long_df.to_csv(long_csv, index=False)
-    with open(long_txt, "w", encoding="utf-8") as f:
-        for _, r in long_df.iterrows():
-            f.write(f"{r['Id']}\t{int(r['N'])}\t{int(r['n_receivers_hour'])}\t{int(r['rate_percent_hour'])}\t{int(r['cumulative_rate_percent'])}\n")
+    write_csv(long_df, long_csv, index=False)
+    write_csv(long_df[["Id", "N", "n_receivers_hour", "rate_percent_hour", "cumulative_rate_percent"]],
+              long_txt, sep="\t", header=False, index=False)
 
     # 横展開（時間×ID、値=その時間の%）
     if not long_df.empty:
         wide = long_df.pivot_table(index="hour_index", columns="Id", values="rate_percent_hour", fill_value=0)
         wide = wide.sort_index(axis=1)
-        wide.to_csv(out_dir / "MH_all_hourly_wide_rates_Rbased.csv")
+        write_csv(wide, out_dir / "MH_all_hourly_wide_rates_Rbased.csv")
 
     return long_df
 
@@ -156,45 +217,50 @@ def calc_high_hourly_R_based_by_cluster(df: pd.DataFrame, nodes_all: set, out_di
     # クラスタ別ノード集合
     cluster_nodes = {c: {n for n in nodes_all if rgx.match(n)} for c, rgx in CLUSTER_REGEX.items()}
 
-    high_R = df[
-        (df["Type"] == "DE")
-        & df["Id"].notna() & df["Id"].astype(str).str.match(ID_HIGH_RE)
-        & (df["Status"] == "R")
-    ].copy()
-
-    if EXCLUDE_BOX_IN_DENOM:
-        high_R = high_R[~high_R["Dst"].astype(str).str.match(BOX_RE)]
-
-    mh_ids = sorted(high_R["Id"].dropna().astype(str).unique().tolist(), key=natural_key)
-
-    records = []
-    for cname, cnodes in cluster_nodes.items():
-        N_c = len(cnodes)
-        sub_cluster = high_R[high_R["Dst"].astype(str).isin(cnodes)].copy()
-        for mid in mh_ids:
-            sub = sub_cluster[sub_cluster["Id"] == mid].copy()
-            seen = set()
-            for h, start, end in hourly_bins(TOTAL_HOURS, BIN_SECONDS):
-                h_slice = sub[(sub["Time"] > start) & (sub["Time"] <= end)]
-                n_hour = h_slice["Dst"].astype(str).nunique()
-                rate_hour = (n_hour / N_c * 100.0) if N_c > 0 else float("nan")
-                seen.update(h_slice["Dst"].astype(str).unique())
-                cum_rate = (len(seen) / N_c * 100.0) if N_c > 0 else float("nan")
-                # NaNは丸めない（後で整形）
-                records.append([mid, h, cname, N_c, n_hour, rate_hour, cum_rate])
-
-    long_df = pd.DataFrame(records, columns=[
-        "Id", "hour_index", "Cluster", "N_cluster",
-        "n_receivers_hour", "rate_percent_hour", "cumulative_rate_percent"
-    ])
+    high_R = select_high_R(df)
+    high_R = pd.DataFrame({
+        "Time": high_R["Time"].to_numpy(),
+        "Id": high_R["Id"].to_numpy().astype(str),
+        "Dst": high_R["Dst"].to_numpy().astype(str),
+        "Cluster": high_R["_cluster"].to_numpy(),
+    })
+
+    mh_ids = sorted(high_R["Id"].unique().tolist(), key=natural_key)
+
+    # 各受信を時間帯に振り分け（範囲外・どのクラスタにも入らない宛先は除く）
+    h = hour_of(high_R["Time"].to_numpy(), TOTAL_HOURS, BIN_SECONDS)
+    rx = high_R.assign(h=h)[(h > 0) & high_R["Cluster"].notna().to_numpy()]
+
+    full_index = pd.MultiIndex.from_product(
+        [list(cluster_nodes.keys()), mh_ids, range(1, TOTAL_HOURS + 1)], names=["Cluster", "Id", "h"])
+    n_hour, n_cum = hourly_receiver_counts(rx, ["Cluster", "Id"], full_index)
+
+    N_c = full_index.get_level_values("Cluster").map({c: len(n) for c, n in cluster_nodes.items()})
+    N_c = np.asarray(N_c, dtype=int)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # NaNは丸めない（後で整形）
+        rate_hour = np.where(N_c > 0, n_hour / N_c * 100.0, np.nan)
+        cum_rate = np.where(N_c > 0, n_cum / N_c * 100.0, np.nan)
+
+    long_df = pd.DataFrame({
+        "Id": full_index.get_level_values("Id"),
+        "hour_index": full_index.get_level_values("h"),
+        "Cluster": full_index.get_level_values("Cluster"),
+        "N_cluster": N_c,
+        "n_receivers_hour": n_hour,
+        "rate_percent_hour": rate_hour,
+        "cumulative_rate_percent": cum_rate,
+    })
     long_csv = out_dir / "MH_all_hourly_progression_by_cluster_Rbased.csv"
     long_txt = out_dir / "MH_all_hourly_progression_by_cluster_Rbased.txt"
-    long_df.to_csv(long_csv, index=False)
-    with open(long_txt, "w", encoding="utf-8") as f:
-        for _, r in long_df.iterrows():
-            rp = "" if (pd.isna(r["rate_percent_hour"])) else str(int(round(r["rate_percent_hour"])))
-            cp = "" if (pd.isna(r["cumulative_rate_percent"])) else str(int(round(r["cumulative_rate_percent"])))
-            f.write(f"{r['Id']}\t{int(r['N_cluster'])}\t{int(r['n_receivers_hour'])}\t{rp}\t{cp}\t{r['Cluster']}\t{int(r['hour_index'])}\n")
+    write_csv(long_df, long_csv, index=False)
+    # テキスト版は率を整数に丸めて出力（NaN は空欄）
+    txt_df = long_df.assign(
+        rp=long_df["rate_percent_hour"].round().astype("Int64"),
+        cp=long_df["cumulative_rate_percent"].round().astype("Int64"),
+    )
+    write_csv(txt_df[["Id", "N_cluster", "n_receivers_hour", "rp", "cp", "Cluster", "hour_index"]],
+              long_txt, sep="\t", header=False, index=False, na_rep="")
 
     # クラスタごと横展開
     for cname in CLUSTER_REGEX.keys():
@@ -203,7 +269,7 @@ def calc_high_hourly_R_based_by_cluster(df: pd.DataFrame, nodes_all: set, out_di
             continue
         wide = sub.pivot_table(index="hour_index", columns="Id", values="rate_percent_hour", fill_value=0)
         wide = wide.sort_index(axis=1)
-        wide.to_csv(out_dir / f"MH_cluster_wide_rates_{cname}_Rbased.csv")
+        write_csv(wide, out_dir / f"MH_cluster_wide_rates_{cname}_Rbased.csv")
 
     return long_df
 
@@ -215,7 +281,7 @@ def calc_low_arrival_rate_first_delivery(df: pd.DataFrame, out_dir: Path):
       - P = DE行のうち Status == 'D' を持つメッセージIDが「少なくとも1回」あるか（IDユニーク）
         ※ A(Delivered-again) は除外、同一IDの複数到達は P=1 として扱う
     """
-    low = df[df["Id"].notna() & df["Id"].astype(str).str.match(ID_LOW_RE)].copy()
+    low = df[df["_id_low"]]
 
     created = low[low["Type"] == "C"]
     L_total = int(created.shape[0])
@@ -230,7 +296,7 @@ def calc_low_arrival_rate_first_delivery(df: pd.DataFrame, out_dir: Path):
         "P_first_delivered_messages": P_total,
         "arrival_rate_percent": (P_total / L_total * 100.0) if L_total > 0 else float("nan")
     }])
-    summary.to_csv(out_dir / "Low_arrival_rate_summary_FIRSTD.csv", index=False)
+    write_csv(summary, out_dir / "Low_arrival_rate_summary_FIRSTD.csv", index=False)
 
     # ID別（各 Id 毎に L と P=0/1）
     L_per_id = created.groupby("Id")["Time"].count().rename("L_created").reset_index()
@@ -243,7 +309,7 @@ def calc_low_arrival_rate_first_delivery(df: pd.DataFrame, out_dir: Path):
         lambda r: (r["P_first_delivered"] / r["L_created"] * 100.0) if r["L_created"] > 0 else float("nan"),
         axis=1
     )
-    per_id.sort_values("Id").to_csv(out_dir / "Low_arrival_rate_by_id_FIRSTD.csv", index=False)
+    write_csv(per_id.sort_values("Id"), out_dir / "Low_arrival_rate_by_id_FIRSTD.csv", index=False)
 
     return summary, per_id
 
@@ -251,6 +317,8 @@ def calc_low_arrival_rate_first_delivery(df: pd.DataFrame, out_dir: Path):
 def main():
     OUT_DIR.mkdir(parents=True, exist_ok=True)
     df = parse_eventlogreport(LOG_PATH)
+    # Id / Dst の判定はここで1回だけ行い、各集計で共有する
+    df = add_classification_columns(df)
 
     # 分母ノード集合（box除外/含む は設定に追従）
     nodes_all = compute_denominator_nodes(df, exclude_box=EXCLUDE_BOX_IN_DENOM)
@@ -1,5 +1,6 @@
 import csv
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import glob
 import re
@@ -19,6 +20,9 @@ for i in range(0, 43200, 3600):
     time = (i, i + 3600)
     time_range.append(time)
 
+# 分割したCSVの列
+CHUNK_COLUMNS = ["Time", "Type", "Host", "Tohost", "Id", "Status"]
+
 # データを時間範囲で分割してCSVに保存
 def process_and_save(input_file, output_dir, time_ranges):
     with open(input_file, "r") as file:
@@ -38,16 +42,37 @@ def process_and_save(input_file, output_dir, time_ranges):
             output_file = Path(output_dir) / f"3cluster_{index}.csv"
             with open(output_file, "w", newline='', encoding="utf-8") as f:
                 writer = csv.writer(f)
-                writer.writerow(["Time", "Type", "Host", "Tohost", "Id", "Status"])
+                writer.writerow(CHUNK_COLUMNS)
                 writer.writerows(grouped_data)
+
+            # 集計用に型付きの DataFrame もキャッシュしておく（CSV を読み直さずに済む）
+            chunk = pd.DataFrame([entry[:len(CHUNK_COLUMNS)] for entry in grouped_data], columns=CHUNK_COLUMNS)
+            chunk['Time'] = chunk['Time'].astype(float)
+            chunk.to_pickle(output_file.with_suffix(".pkl"))
             print(f"Saved {len(grouped_data)} entries to {output_file}")
 
+# 分割したファイルを読み込む（キャッシュがあればそちらを使う）
+def read_chunk(file_path):
+    cache_path = Path(file_path).with_suffix(".pkl")
+    if cache_path.exists():
+        return pd.read_pickle(cache_path)
+    return pd.read_csv(file_path)
+
 # データ伝搬率 High の計算（宛先を重複なくカウント）
 def calculate_high(output_dir, id_prefix, step=3, max_id=36):
     # 自然順ソートでファイルリストを取得
     file_list = sorted(glob.glob(f"{output_dir}/3cluster_*.csv"), key=natural_sort_key)
     all_results = []  # すべての ID の結果を保持
 
+    # 各ファイルは1回だけ読み、ノード数と ID ごとの R 宛先（重複なし）を先に求めておく
+    file_stats = []
+    for file_path in file_list:
+        data = read_chunk(file_path)
+        total_nodes = pd.concat([data['Host'], data['Tohost']]).drop_duplicates().nunique()
+        received = data[data['Status'] == 'R'].drop_duplicates(['Id', 'Tohost'])
+        r_by_id = received.groupby('Id')['Tohost'].apply(list).to_dict()
+        file_stats.append((file_path, total_nodes, r_by_id))
+
     for id_index in range(1, max_id + 1, step):  # `step` 間隔で処理
         target_id = f"{id_prefix}{id_index}"  # 処理対象の ID（例: M_Hp1, M_Hp3）
 
@@ -55,14 +80,10 @@ def calculate_high(output_dir, id_prefix, step=3, max_id=36):
         seen_tohosts = set()  # すべてのファイルで受け取った宛先のリストを保持
         cumulative_high = 0  # High の累積結果を保持
 
-        for file_path in file_list:
-            data = pd.read_csv(file_path)
-
-            total_nodes = pd.concat([data['Host'], data['Tohost']]).drop_duplicates().nunique()
-
+        for file_path, total_nodes, r_by_id in file_stats:
             # 新たに受け取った宛先をリストに追加する前に重複しないようにする
             mh_received_nodes = 0
-            for tohost in data[(data['Id'] == target_id) & (data['Status'] == 'R')]['Tohost'].drop_duplicates():
+            for tohost in r_by_id.get(target_id, []):
                 if tohost not in seen_tohosts:  # まだカウントされていない宛先
                     seen_tohosts.add(tohost)  # 宛先をリストに追加
                     mh_received_nodes += 1
@@ -90,26 +111,31 @@ def calculate_high(output_dir, id_prefix, step=3, max_id=36):
 def calculate_low(output_dir):
     # 自然順ソートでファイルリストを取得
     file_list = sorted(glob.glob(f"{output_dir}/3cluster_*.csv"), key=natural_sort_key)
+    frames = [read_chunk(file_path) for file_path in file_list]
     results = []
 
-    seen_tohosts = set()  # すべてのファイルで受け取った宛先のリストを保持
+    # 宛先はすべてのファイルで共通の整数コードにし、受け取り済みかどうかを 0/1 の表で持つ
+    tohost_codes, tohosts = pd.factorize(pd.concat([data['Tohost'] for data in frames])) if frames else ([], [])
+    seen_tohosts = np.zeros(len(tohosts), dtype=np.uint8)  # すべてのファイルで受け取った宛先
+
+    offset = 0
+    for file_path, data in zip(file_list, frames):
+        codes = np.asarray(tohost_codes[offset:offset + len(data)])
+        offset += len(data)
+
+        # 'M_L' に関連するデータ
+        is_ml = data['Id'].str.startswith('M_L', na=False).to_numpy()
 
-    for file_path in file_list:
-        data = pd.read_csv(file_path)
-        
-        # 'M_L' に関連するデータをフィルタリング
-        ml_data = data[data['Id'].str.startswith('M_L')]
-        
         # 作成数（全ての 'M_L'）
-        ml_created = len(ml_data)
-        
-        # 新たに受け取った宛先をリストに追加する前に重複しないようにする
-        ml_received = 0
-        for tohost in ml_data[ml_data['Status'] == 'D']['Tohost']:
-            if tohost not in seen_tohosts:  # まだカウントされていない宛先
-                seen_tohosts.add(tohost)  # 宛先をリストに追加
-                ml_received += 2
-        
+        ml_created = int(is_ml.sum())
+
+        # 新たに受け取った宛先（まだカウントされていない宛先だけ）
+        received = np.unique(codes[is_ml & (data['Status'] == 'D').to_numpy()])
+        received = received[received >= 0]
+        new_tohosts = received[seen_tohosts[received] == 0]
+        seen_tohosts[new_tohosts] = 1
+        ml_received = len(new_tohosts)
+
         Low = (ml_received / ml_created) * 100 if ml_created > 0 else 0
         results.append({
             'File': file_path, 'M_L Created': ml_created, 'M_L Received': ml_received, 'Low': Low